@@ -5,9 +5,11 @@ Supports bar, line, pie, doughnut, scatter, and horizontal bar charts.
 Also generates multi-chart dashboard HTML pages.
 """
 
-import json
 import os
 from datetime import datetime
+from decimal import Decimal
+from operator import itemgetter
+import orjson
 
 
 # Curated color palettes for charts
@@ -29,10 +31,32 @@ CHART_COLORS = [
 CHART_BORDER_COLORS = [c.replace("0.85", "1") for c in CHART_COLORS]
 
 
+def safe_float(value) -> float:
+    """Convert a result cell to a chart value, using 0 for non-numeric cells."""
+    # Numbers are the common case and convert without raising
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _config_json(config: dict) -> str:
+    """Serialize a Chart.js config for embedding; non-JSON values become strings."""
+    return orjson.dumps(
+        config,
+        default=str,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+    ).decode()
+
+
 def _get_chart_html(chart_config: dict, title: str, width: str = "100%", height: str = "500px") -> str:
     """Generate a self-contained HTML page with a Chart.js chart."""
 
-    config_json = json.dumps(chart_config, indent=2, default=str)
+    config_json = _config_json(chart_config)
 
     return f"""<!DOCTYPE html>
 <html lang="en" data-theme="dark">
@@ -233,18 +257,12 @@ def generate_chart(
         y_indices = [1] if len(columns) > 1 else [0]
 
     # Extract data
-    labels = [str(row[x_idx]) for row in rows]
+    labels = list(map(str, map(itemgetter(x_idx), rows)))
 
     datasets = []
     for i, y_idx in enumerate(y_indices):
         col_name = columns[y_idx] if y_idx < len(columns) else f"Series {i + 1}"
-        values = []
-        for row in rows:
-            val = row[y_idx]
-            try:
-                values.append(float(val))
-            except (TypeError, ValueError):
-                values.append(0)
+        values = list(map(safe_float, map(itemgetter(y_idx), rows)))
 
         color_idx = i % len(CHART_COLORS)
 
@@ -352,7 +370,7 @@ def generate_dashboard(
     """
     chart_blocks = []
     for i, chart in enumerate(charts):
-        config_json = json.dumps(chart["config"], indent=2, default=str)
+        config_json = _config_json(chart["config"])
         chart_blocks.append(f"""
             <div class="chart-card">
                 <h3>{chart['title']}</h3>
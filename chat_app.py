@@ -7,21 +7,49 @@ type natural language questions and get SQL, results, and charts back.
 
 import os
 import json
+import asyncio
 import base64
+import hashlib
+import shutil
+from decimal import Decimal
+from operator import itemgetter
 from pathlib import Path
-from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+from typing import BinaryIO
+import anyio.to_thread
+import orjson
+from fastapi import FastAPI, Header, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
 
 from db_manager import DatabaseManager
 from nl_engine import NLEngine
-from chart_generator import generate_chart as create_chart, CHART_COLORS, CHART_BORDER_COLORS
+from chart_generator import generate_chart as create_chart, safe_float, CHART_COLORS, CHART_BORDER_COLORS
 
-app = FastAPI(title="QueryNLP")
+
+def _json_default(obj):
+    """Serialize driver values orjson doesn't handle natively (e.g. Decimal, BLOBs)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode(errors="replace")
+    return str(obj)
+
+
+class APIResponse(JSONResponse):
+    """orjson-rendered JSON response that tolerates arbitrary DB value types."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(title="QueryNLP", default_response_class=APIResponse)
 
 # Shared state
 db = DatabaseManager()
 engine: NLEngine | None = None
+warmup: asyncio.Task | None = None  # background connect to the sample DB
 
 # Auto-connect to sample DB on startup
 SAMPLE_DB = os.path.join(os.path.dirname(__file__), "sample_data", "sample.db")
@@ -30,121 +58,157 @@ SAMPLE_DB = os.path.join(os.path.dirname(__file__), "sample_data", "sample.db")
 # Ensure upload directory exists
 UPLOAD_DIR = Path(__file__).parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# The chat UI is read once and served from memory; the ETag lets browsers revalidate
+INDEX_HTML = (Path(__file__).parent / "chat_ui.html").read_bytes()
+INDEX_ETAG = f'"{hashlib.blake2b(INDEX_HTML, digest_size=16).hexdigest()}"'
+
+# Worker threads available to sync path operations (DB + OpenAI calls block)
+THREADPOOL_SIZE = 64
+
+
+class ConnectBody(BaseModel):
+    db_type: str = "sqlite"
+    connection_string: str = ""
+
+
+class QuestionBody(BaseModel):
+    question: str = ""
+
+
+def _report_warmup_failure(task: asyncio.Task) -> None:
+    """Log a failed sample-DB connect instead of leaving the exception unretrieved."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️  Could not connect to the sample database: {task.exception()}")
 
 
 @app.on_event("startup")
 async def startup():
-    global engine
+    global engine, warmup
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     if os.path.exists(SAMPLE_DB):
-        db.connect("sqlite", SAMPLE_DB)
+        # Introspect off the event loop so the server is ready immediately
+        warmup = asyncio.create_task(run_in_threadpool(db.connect, "sqlite", SAMPLE_DB))
+        warmup.add_done_callback(_report_warmup_failure)
     try:
         engine = NLEngine()
     except ValueError:
         print("⚠️  OPENAI_API_KEY not set. Set it to enable NL-to-SQL.")
 
 
+WARMING_UP_ERROR = {"error": "Database is still loading, try again shortly"}
+
+
+def _warming_up() -> bool:
+    """True while the sample database is still being introspected."""
+    return warmup is not None and not warmup.done()
+
+
 @app.get("/", response_class=HTMLResponse)
-async def index():
+async def index(if_none_match: str | None = Header(default=None)):
     """Serve the chat UI."""
-    html_path = os.path.join(os.path.dirname(__file__), "chat_ui.html")
-    with open(html_path, "r") as f:
-        return HTMLResponse(content=f.read())
+    if if_none_match == INDEX_ETAG:
+        return Response(status_code=304, headers={"ETag": INDEX_ETAG})
+    return HTMLResponse(content=INDEX_HTML, headers={"ETag": INDEX_ETAG})
 
 
 @app.get("/api/schema")
-async def get_schema():
+def get_schema():
     """Return the current database schema."""
+    if _warming_up():
+        return APIResponse(WARMING_UP_ERROR, status_code=503)
     if not db.connection:
-        return JSONResponse({"error": "No database connected"}, status_code=400)
-    return {
+        return APIResponse({"error": "No database connected"}, status_code=400)
+    return APIResponse({
         "schema": db.schema,
         "description": db.get_schema_description(),
         "db_type": db.db_type,
-    }
+    })
 
 
 @app.post("/api/connect")
-async def connect_database(request: Request):
+def connect_database(body: ConnectBody):
     """Connect to a database."""
-    body = await request.json()
-    db_type = body.get("db_type", "sqlite")
-    connection_string = body.get("connection_string", "")
+    if _warming_up():
+        return APIResponse(WARMING_UP_ERROR, status_code=503)
     try:
-        db.connect(db_type, connection_string)
-        table_count = len(db.schema)
-        total_rows = sum(t["row_count"] for t in db.schema.values())
+        db.connect(body.db_type, body.connection_string)
+        summary = db.summary()
         return {
             "success": True,
-            "tables": table_count,
-            "rows": total_rows,
-            "schema": db.get_schema_description(),
+            "tables": summary["tables"],
+            "rows": summary["rows"],
+            "schema": summary["description"],
         }
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=400)
+        return APIResponse({"error": str(e)}, status_code=400)
 
 
 @app.post("/api/upload")
 async def upload_database(file: UploadFile = File(...)):
     """Upload a SQLite database file and connect to it."""
     if not file.filename.endswith((".db", ".sqlite")):
-        return JSONResponse({"error": "Only .db or .sqlite files are allowed"}, status_code=400)
+        return APIResponse({"error": "Only .db or .sqlite files are allowed"}, status_code=400)
+    if _warming_up():
+        return APIResponse(WARMING_UP_ERROR, status_code=503)
 
-    file_path = UPLOAD_DIR / file.filename
+    return await run_in_threadpool(_save_and_connect, file.filename, file.file)
+
+
+def _save_and_connect(filename: str, upload: BinaryIO):
+    """Copy an uploaded SQLite file to disk in chunks and connect to it."""
+    file_path = UPLOAD_DIR / filename
     try:
         with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+            shutil.copyfileobj(upload, buffer, UPLOAD_CHUNK_SIZE)
 
         # Connect to the uploaded database
         db.connect("sqlite", str(file_path))
 
-        table_count = len(db.schema)
-        total_rows = sum(t["row_count"] for t in db.schema.values())
+        summary = db.summary()
         return {
             "success": True,
-            "filename": file.filename,
-            "tables": table_count,
-            "rows": total_rows,
-            "schema": db.get_schema_description(),
+            "filename": filename,
+            "tables": summary["tables"],
+            "rows": summary["rows"],
+            "schema": summary["description"],
         }
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return APIResponse({"error": str(e)}, status_code=500)
 
 
 @app.post("/api/ask")
-async def ask_question(request: Request):
+async def ask_question(body: QuestionBody):
     """Process a natural language question and return SQL + results + chart config."""
+    if _warming_up():
+        return APIResponse(WARMING_UP_ERROR, status_code=503)
     if not db.connection:
-        return JSONResponse({"error": "No database connected"}, status_code=400)
+        return APIResponse({"error": "No database connected"}, status_code=400)
     if not engine:
-        return JSONResponse({"error": "OpenAI API key not configured"}, status_code=400)
+        return APIResponse({"error": "OpenAI API key not configured"}, status_code=400)
 
-    body = await request.json()
-    question = body.get("question", "").strip()
+    question = body.question.strip()
     if not question:
-        return JSONResponse({"error": "No question provided"}, status_code=400)
+        return APIResponse({"error": "No question provided"}, status_code=400)
 
     try:
         # Generate SQL
         schema_desc = db.get_schema_description()
-        sql = engine.generate_sql(schema_desc, question, db.db_type)
+        sql = await run_in_threadpool(engine.generate_sql, schema_desc, question, db.db_type)
 
         # Execute query
-        result = db.execute_query(sql)
-        markdown_table = db.format_results_as_markdown(result)
-
-        # Get chart suggestion
-        chart_config = None
-        if result["rows"] and len(result["columns"]) >= 2:
-            try:
-                suggestion = engine.suggest_chart_type(
-                    question, result["columns"], result["rows"]
-                )
-                chart_config = _build_chart_config(result, suggestion)
-            except Exception:
-                pass  # Chart is optional
+        result = await run_in_threadpool(db.execute_query, sql)
 
-        return {
+        # The chart prompt embeds sample rows, so it can only start once the
+        # query has run; overlap that LLM round-trip with table formatting.
+        markdown_table, chart_config = await asyncio.gather(
+            run_in_threadpool(db.format_results_as_markdown, result),
+            _suggest_chart_config(question, result),
+        )
+
+        # Returned as a response directly so the rows skip jsonable_encoder
+        return APIResponse({
             "question": question,
             "sql": sql,
             "columns": result["columns"],
@@ -152,23 +216,37 @@ async def ask_question(request: Request):
             "row_count": result["row_count"],
             "markdown_table": markdown_table,
             "chart_config": chart_config,
-        }
+        })
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return APIResponse({"error": str(e)}, status_code=500)
+
+
+async def _suggest_chart_config(question: str, result: dict) -> dict | None:
+    """Get a chart suggestion for the results and build its Chart.js config."""
+    if not result["rows"] or len(result["columns"]) < 2:
+        return None
+    try:
+        suggestion = await run_in_threadpool(
+            engine.suggest_chart_type, question, result["columns"], result["rows"]
+        )
+        return _build_chart_config(result, suggestion)
+    except Exception:
+        return None  # Chart is optional
 
 
 @app.post("/api/explain")
-async def explain_query(request: Request):
+def explain_query(body: QuestionBody):
     """Generate SQL and explain it step by step."""
+    if _warming_up():
+        return APIResponse(WARMING_UP_ERROR, status_code=503)
     if not db.connection:
-        return JSONResponse({"error": "No database connected"}, status_code=400)
+        return APIResponse({"error": "No database connected"}, status_code=400)
     if not engine:
-        return JSONResponse({"error": "OpenAI API key not configured"}, status_code=400)
+        return APIResponse({"error": "OpenAI API key not configured"}, status_code=400)
 
-    body = await request.json()
-    question = body.get("question", "").strip()
+    question = body.question.strip()
     if not question:
-        return JSONResponse({"error": "No question provided"}, status_code=400)
+        return APIResponse({"error": "No question provided"}, status_code=400)
 
     try:
         schema_desc = db.get_schema_description()
@@ -176,7 +254,7 @@ async def explain_query(request: Request):
         explanation = engine.explain_sql(sql, schema_desc)
         return {"question": question, "sql": sql, "explanation": explanation}
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return APIResponse({"error": str(e)}, status_code=500)
 
 
 def _build_chart_config(result: dict, suggestion: dict) -> dict:
@@ -188,20 +266,19 @@ def _build_chart_config(result: dict, suggestion: dict) -> dict:
     y_cols = suggestion.get("y_columns", columns[1:2])
     chart_type = suggestion.get("chart_type", "bar")
 
-    x_idx = columns.index(x_col) if x_col in columns else 0
-    labels = [str(row[x_idx]) for row in rows]
+    col_idx = {c: i for i, c in enumerate(columns)}
+    default_y_idx = 1 if len(columns) > 1 else 0
+    n_colors = len(CHART_COLORS)
+
+    x_idx = col_idx.get(x_col, 0)
+    labels = list(map(str, map(itemgetter(x_idx), rows)))
 
     datasets = []
     for i, yc in enumerate(y_cols):
-        y_idx = columns.index(yc) if yc in columns else (1 if len(columns) > 1 else 0)
-        values = []
-        for row in rows:
-            try:
-                values.append(float(row[y_idx]))
-            except (TypeError, ValueError):
-                values.append(0)
-
-        color_idx = i % len(CHART_COLORS)
+        y_idx = col_idx.get(yc, default_y_idx)
+        values = list(map(safe_float, map(itemgetter(y_idx), rows)))
+
+        color_idx = i % n_colors
         ds = {
             "label": yc,
             "data": values,
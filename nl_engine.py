@@ -4,10 +4,223 @@ NL-to-SQL Engine — converts natural language questions to SQL using OpenAI GPT
 Also provides SQL explanation and chart type suggestion capabilities.
 """
 
-import json
+import hashlib
 import os
+import re
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+import orjson
+from cachetools import TTLCache
 from openai import OpenAI
 
+# Cached LLM responses — identical prompts are answered without a round-trip
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 3600
+
+# Chart types the chart builders know how to render
+CHART_TYPES = ("bar", "line", "pie", "doughnut", "scatter", "horizontalBar")
+
+# Rows inspected to infer a result column's type
+DTYPE_SAMPLE_ROWS = 5
+# Most slices a heuristically chosen pie chart may have
+PIE_MAX_SLICES = 6
+
+# ISO-style dates/timestamps and year-month periods as returned in text columns
+_TEMPORAL_TEXT = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}.*)?$")
+# Question wording that asks for a part-of-whole breakdown
+_PROPORTION_WORDS = re.compile(r"\b(share|proportion|percent|percentage|distribution|breakdown|split)\b", re.I)
+
+# Reasoning of the suggestion returned when the model gives no usable answer;
+# such suggestions are never cached
+FALLBACK_CHART_REASONING = "Default fallback to bar chart."
+
+# Leading/trailing markdown code fence, e.g. "```sql\n" ... "```"
+_FENCE = re.compile(r"^\s*```(?:[\w-]*[ \t]*\n)?|\n?```\s*$")
+
+
+# System prompts put the static instructions first and the schema last, so
+# consecutive requests share the longest possible prefix for server-side
+# prompt caching; the per-request question/SQL always goes in the user message.
+_SQL_RULES = """1. Generate ONLY SELECT queries — never INSERT, UPDATE, DELETE, DROP, ALTER, CREATE, or TRUNCATE.
+2. Use the SQL dialect named under SQL DIALECT below.
+3. Always use proper table and column names from the schema.
+4. Use JOINs when the question requires data from multiple tables.
+5. Use appropriate aggregation functions (COUNT, SUM, AVG, MIN, MAX) when needed.
+6. Add ORDER BY clauses when the question implies ranking or sorting.
+7. Add LIMIT when the question asks for "top N" or similar.
+8. Use aliases for readability.
+9. Handle date operations using the correct dialect functions."""
+
+_SQL_INSTRUCTIONS = f"""You are an expert SQL query generator. Your job is to convert natural language questions into precise, efficient SQL queries.
+
+RULES:
+{_SQL_RULES}
+10. Return ONLY the raw SQL query with no markdown formatting, no explanation, no backticks — just the SQL."""
+
+_BATCH_INSTRUCTIONS = f"""You are an expert SQL query generator and data visualization expert. For each numbered question, write one precise, efficient SQL query and choose the best chart for its result.
+
+SQL RULES:
+{_SQL_RULES}
+
+CHART GUIDELINES:
+- Use BAR for comparisons between categories
+- Use LINE for time series / trends
+- Use PIE/DOUGHNUT for proportions/percentages (max 8 slices)
+- Use SCATTER for correlations between two numeric values
+- Use HORIZONTAL BAR for many categories or long labels
+- x_column is the label/category column of your query's result
+- y_columns are the numeric/value columns of your query's result
+
+Return exactly one entry per question, in the same order as the questions."""
+
+_REWRITE_INSTRUCTIONS = """You are an expert SQL performance tuner. Rewrite the given SQL query into a semantically equivalent query that executes faster.
+
+RULES:
+1. The rewritten query MUST return exactly the same rows, columns, column names, and ordering.
+2. Push filter predicates down as close to the tables they apply to as possible.
+3. Eliminate redundant subqueries, joins, and DISTINCTs.
+4. Convert IN (SELECT ...) to EXISTS, and correlated subqueries to joins, where that is equivalent.
+5. Keep LIMIT as early as the semantics allow, e.g. inside a CTE that feeds only the limited result.
+6. Generate ONLY SELECT queries, in the SQL dialect named under SQL DIALECT below.
+7. If the query is already efficient, return it unchanged.
+8. Return ONLY the raw SQL query with no markdown formatting, no explanation, no backticks — just the SQL."""
+
+_EXPLAIN_INSTRUCTIONS = """You are an expert SQL educator. Explain the given SQL query in plain English, step by step.
+
+RULES:
+1. Break down the query into logical steps.
+2. Explain what each clause does (SELECT, FROM, JOIN, WHERE, GROUP BY, ORDER BY, LIMIT, etc.).
+3. Describe the expected output — what columns and what kind of data the user will see.
+4. If there are JOINs, explain why those tables are being connected.
+5. If there are aggregations, explain what they compute.
+6. Keep the explanation clear and concise, suitable for someone learning SQL.
+7. Format the response in markdown with numbered steps."""
+
+
+@lru_cache(maxsize=32)
+def _prompt_with_schema(instructions: str, schema_description: str, db_type: str | None = None) -> str:
+    """Append the (per-connection constant) dialect and schema to static instructions."""
+    dialect = f"\n\nSQL DIALECT: {db_type}" if db_type else ""
+    return f"{instructions}{dialect}\n\nDATABASE SCHEMA:\n{schema_description}"
+
+
+def _infer_dtype(rows: list[tuple], i: int) -> str:
+    """Classify column i as 'numeric', 'temporal', 'text', or 'unknown' from the first rows."""
+    kinds = set()
+    for row in rows[:DTYPE_SAMPLE_ROWS]:
+        value = row[i]
+        if value is None:
+            continue
+        if isinstance(value, (date, datetime)):
+            kinds.add("temporal")
+        elif isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            kinds.add("numeric")
+        elif isinstance(value, str) and _TEMPORAL_TEXT.match(value):
+            kinds.add("temporal")
+        else:
+            kinds.add("text")
+    if len(kinds) == 1:
+        return kinds.pop()
+    return "text" if kinds else "unknown"
+
+
+def column_signature(columns: list[str], rows: list[tuple]) -> tuple:
+    """(name, inferred type) per column — what a chart suggestion depends on."""
+    return tuple((column, _infer_dtype(rows, i)) for i, column in enumerate(columns))
+
+
+def suggest_chart_type_heuristic(question: str, columns: list[str], rows: list[tuple]) -> dict | None:
+    """
+    Pick a chart for simple label + value results without asking the model.
+
+    Returns:
+        A suggestion dict like NLEngine.suggest_chart_type's, or None when the
+        result shape is ambiguous and the model should decide.
+    """
+    if len(columns) != 2 or not rows:
+        return None
+    dtypes = [_infer_dtype(rows, 0), _infer_dtype(rows, 1)]
+    if dtypes.count("numeric") != 1:
+        return None
+    y = dtypes.index("numeric")
+    x = 1 - y
+
+    if dtypes[x] == "temporal":
+        chart_type, reasoning = "line", "A time column with one numeric series is a trend."
+    elif dtypes[x] == "text":
+        if len(rows) <= PIE_MAX_SLICES and _PROPORTION_WORDS.search(question):
+            chart_type, reasoning = "pie", "A few categories as parts of a whole."
+        else:
+            chart_type, reasoning = "bar", "One numeric value per category is a comparison."
+    else:
+        return None
+
+    return {
+        "chart_type": chart_type,
+        "x_column": columns[x],
+        "y_columns": [columns[y]],
+        "title": question,
+        "reasoning": reasoning,
+    }
+
+
+def _chart_response_format(columns: list[str]) -> dict:
+    """Structured-output schema for a chart suggestion over the given columns."""
+    column_enum = {"type": "string", "enum": list(dict.fromkeys(columns))}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "chart_suggestion",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "chart_type": {"type": "string", "enum": list(CHART_TYPES)},
+                    "x_column": column_enum,
+                    "y_columns": {"type": "array", "items": column_enum},
+                    "title": {"type": "string"},
+                    "reasoning": {"type": "string"},
+                },
+                "required": ["chart_type", "x_column", "y_columns", "title", "reasoning"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+# One SQL query plus chart configuration per dashboard question
+_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "dashboard_charts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "charts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "sql": {"type": "string"},
+                            "chart_type": {"type": "string", "enum": list(CHART_TYPES)},
+                            "x_column": {"type": "string"},
+                            "y_columns": {"type": "array", "items": {"type": "string"}},
+                            "title": {"type": "string"},
+                        },
+                        "required": ["sql", "chart_type", "x_column", "y_columns", "title"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["charts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 
 class NLEngine:
     """Natural language to SQL conversion engine powered by OpenAI."""
@@ -21,6 +234,26 @@ class NLEngine:
             )
         self.client = OpenAI(api_key=self.api_key)
         self.model = "gpt-4o"
+        self._cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _schema_key(schema_description: str) -> bytes:
+        """Short digest of the schema so cache keys don't hold the full text."""
+        return hashlib.blake2b(schema_description.encode(), digest_size=16).digest()
+
+    def _cache_get(self, key: tuple):
+        with self._cache_lock:
+            return self._cache.get(key)
+
+    def _cache_set(self, key: tuple, value) -> None:
+        with self._cache_lock:
+            self._cache[key] = value
+
+    @staticmethod
+    def _strip_fence(text: str) -> str:
+        """Remove any markdown code fence the model wrapped its answer in."""
+        return _FENCE.sub("", text).strip()
 
     def generate_sql(self, schema_description: str, question: str, db_type: str = "sqlite") -> str:
         """
@@ -34,22 +267,12 @@ class NLEngine:
         Returns:
             SQL query string.
         """
-        system_prompt = f"""You are an expert SQL query generator. Your job is to convert natural language questions into precise, efficient SQL queries.
-
-DATABASE SCHEMA:
-{schema_description}
+        cache_key = ("sql", self._schema_key(schema_description), question.strip().lower(), db_type)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
-RULES:
-1. Generate ONLY a SELECT query — never INSERT, UPDATE, DELETE, DROP, ALTER, CREATE, or TRUNCATE.
-2. Use the correct SQL dialect for {db_type}.
-3. Always use proper table and column names from the schema.
-4. Use JOINs when the question requires data from multiple tables.
-5. Use appropriate aggregation functions (COUNT, SUM, AVG, MIN, MAX) when needed.
-6. Add ORDER BY clauses when the question implies ranking or sorting.
-7. Add LIMIT when the question asks for "top N" or similar.
-8. Use aliases for readability.
-9. Handle date operations using the correct dialect functions.
-10. Return ONLY the raw SQL query with no markdown formatting, no explanation, no backticks — just the SQL."""
+        system_prompt = _prompt_with_schema(_SQL_INSTRUCTIONS, schema_description, db_type)
 
         response = self.client.chat.completions.create(
             model=self.model,
@@ -61,17 +284,105 @@ RULES:
             max_tokens=1000,
         )
 
-        sql = response.choices[0].message.content.strip()
-
         # Clean up any accidental markdown formatting
-        if sql.startswith("```"):
-            sql = sql.split("\n", 1)[1] if "\n" in sql else sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
-        sql = sql.strip()
+        sql = self._strip_fence(response.choices[0].message.content)
 
+        self._cache_set(cache_key, sql)
         return sql
 
+    def generate_sql_batch(
+        self, schema_description: str, questions: list[str], db_type: str = "sqlite"
+    ) -> list[dict]:
+        """
+        Convert several questions to SQL and chart configurations in one LLM call.
+
+        Used for dashboards, where one round-trip for N questions amortizes the
+        prompt prefix and network latency that N separate calls would each pay.
+
+        Args:
+            schema_description: Human-readable schema description.
+            questions: Natural language questions, one chart each.
+            db_type: Database dialect (sqlite, postgresql, mysql).
+
+        Returns:
+            One dict per question, in order, with 'sql', 'chart_type', 'x_column',
+            'y_columns', and 'title'.
+
+        Raises:
+            ValueError: If the response doesn't contain one entry per question.
+        """
+        if not questions:
+            return []
+        cache_key = (
+            "sql_batch",
+            self._schema_key(schema_description),
+            tuple(q.strip().lower() for q in questions),
+            db_type,
+        )
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return [dict(spec) for spec in cached]
+
+        system_prompt = _prompt_with_schema(_BATCH_INSTRUCTIONS, schema_description, db_type)
+
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": numbered},
+            ],
+            temperature=0.0,
+            max_tokens=min(16000, 800 * len(questions)),
+            response_format=_BATCH_RESPONSE_FORMAT,
+        )
+
+        specs = orjson.loads(response.choices[0].message.content or "{}").get("charts", [])
+        if len(specs) != len(questions):
+            raise ValueError(
+                f"Expected {len(questions)} charts in batch response, got {len(specs)}"
+            )
+        for spec in specs:
+            spec["sql"] = self._strip_fence(spec["sql"])
+
+        self._cache_set(cache_key, specs)
+        return [dict(spec) for spec in specs]
+
+    def rewrite_sql(self, sql: str, schema_description: str, db_type: str = "sqlite") -> str:
+        """
+        Rewrite a SQL query into a semantically equivalent, faster one.
+
+        Args:
+            sql: The SQL query to rewrite.
+            schema_description: Schema context for the rewrite.
+            db_type: Database dialect (sqlite, postgresql, mysql).
+
+        Returns:
+            Rewritten SQL query string.
+        """
+        cache_key = ("rewrite", self._schema_key(schema_description), sql, db_type)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        system_prompt = _prompt_with_schema(_REWRITE_INSTRUCTIONS, schema_description, db_type)
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": sql},
+            ],
+            temperature=0.0,
+            max_tokens=1000,
+        )
+
+        # Fall back to the original query if the model returns nothing usable
+        rewritten = self._strip_fence(response.choices[0].message.content or "") or sql
+
+        self._cache_set(cache_key, rewritten)
+        return rewritten
+
     def explain_sql(self, sql: str, schema_description: str) -> str:
         """
         Generate a human-readable explanation of a SQL query.
@@ -83,19 +394,12 @@ RULES:
         Returns:
             Step-by-step explanation string.
         """
-        system_prompt = f"""You are an expert SQL educator. Explain the given SQL query in plain English, step by step.
+        cache_key = ("explain", self._schema_key(schema_description), sql)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
-DATABASE SCHEMA:
-{schema_description}
-
-RULES:
-1. Break down the query into logical steps.
-2. Explain what each clause does (SELECT, FROM, JOIN, WHERE, GROUP BY, ORDER BY, LIMIT, etc.).
-3. Describe the expected output — what columns and what kind of data the user will see.
-4. If there are JOINs, explain why those tables are being connected.
-5. If there are aggregations, explain what they compute.
-6. Keep the explanation clear and concise, suitable for someone learning SQL.
-7. Format the response in markdown with numbered steps."""
+        system_prompt = _prompt_with_schema(_EXPLAIN_INSTRUCTIONS, schema_description)
 
         response = self.client.chat.completions.create(
             model=self.model,
@@ -107,10 +411,12 @@ RULES:
             max_tokens=1500,
         )
 
-        return response.choices[0].message.content.strip()
+        explanation = response.choices[0].message.content.strip()
+        self._cache_set(cache_key, explanation)
+        return explanation
 
     def suggest_chart_type(
-        self, question: str, columns: list[str], sample_data: list[list]
+        self, question: str, columns: list[str], sample_data: list[tuple]
     ) -> dict:
         """
         Suggest the best chart type and configuration for the given data.
@@ -123,20 +429,24 @@ RULES:
         Returns:
             Dict with 'chart_type', 'x_column', 'y_columns', 'title'.
         """
-        data_preview = json.dumps(
-            {"columns": columns, "sample_rows": sample_data[:10]}, indent=2
-        )
+        # Simple label + value results don't need a model round-trip
+        suggestion = suggest_chart_type_heuristic(question, columns, sample_data)
+        if suggestion is not None:
+            return suggestion
 
-        system_prompt = """You are a data visualization expert. Given a question and query results, suggest the best chart type and configuration.
+        # The answer depends on the question and the column types, not the values
+        cache_key = ("chart", question, column_signature(columns, sample_data))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return dict(cached)
 
-RESPOND WITH ONLY valid JSON (no markdown, no backticks) in this format:
-{
-    "chart_type": "bar|line|pie|doughnut|scatter|horizontalBar",
-    "x_column": "column_name_for_x_axis",
-    "y_columns": ["column_name_for_y_axis"],
-    "title": "Human-readable chart title",
-    "reasoning": "Brief explanation of why this chart type was chosen"
-}
+        data_preview = orjson.dumps(
+            {"columns": columns, "sample_rows": sample_data[:10]},
+            default=str,
+            option=orjson.OPT_INDENT_2,
+        ).decode()
+
+        system_prompt = """You are a data visualization expert. Given a question and query results, suggest the best chart type and configuration.
 
 GUIDELINES:
 - Use BAR for comparisons between categories
@@ -145,7 +455,8 @@ GUIDELINES:
 - Use SCATTER for correlations between two numeric values
 - Use HORIZONTAL BAR for many categories or long labels
 - x_column should be the label/category column
-- y_columns should be the numeric/value columns"""
+- y_columns should be the numeric/value columns
+- title is a human-readable chart title; reasoning briefly explains the choice"""
 
         response = self.client.chat.completions.create(
             model=self.model,
@@ -158,25 +469,22 @@ GUIDELINES:
             ],
             temperature=0.0,
             max_tokens=500,
+            response_format=_chart_response_format(columns),
         )
 
-        text = response.choices[0].message.content.strip()
-
-        # Clean up markdown if present
-        if text.startswith("```"):
-            text = text.split("\n", 1)[1] if "\n" in text else text[3:]
-        if text.endswith("```"):
-            text = text[:-3]
-        text = text.strip()
-
+        # Structured outputs guarantee schema-valid JSON unless the model refuses
+        text = response.choices[0].message.content
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
+            suggestion = orjson.loads(text or "")
+        except orjson.JSONDecodeError:
             # Fallback: default to bar chart
             return {
                 "chart_type": "bar",
                 "x_column": columns[0] if columns else "label",
                 "y_columns": columns[1:2] if len(columns) > 1 else columns[:1],
                 "title": question,
-                "reasoning": "Default fallback to bar chart.",
+                "reasoning": FALLBACK_CHART_REASONING,
             }
+
+        self._cache_set(cache_key, suggestion)
+        return dict(suggestion)
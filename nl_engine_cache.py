@@ -0,0 +1,157 @@
+"""
+NL Engine Cache — persists LLM answers across MCP server restarts.
+
+MCP clients usually start a fresh server process per session, so the in-memory
+cache inside NLEngine starts empty every time. CachedNLEngine wraps an NLEngine
+and stores its SQL, explanations, and chart suggestions in a small SQLite file.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import orjson
+
+from nl_engine import (
+    FALLBACK_CHART_REASONING,
+    NLEngine,
+    column_signature,
+    suggest_chart_type_heuristic,
+)
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "nlengine.sqlite")
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _cache_key(kind: str, *parts) -> str:
+    """Stable key for a cached response of the given kind."""
+    return f"{kind}:{hashlib.sha1(orjson.dumps(parts)).hexdigest()}"
+
+
+class CachedNLEngine:
+    """NLEngine wrapper that answers repeated prompts from an on-disk cache."""
+
+    def __init__(self, engine: NLEngine, path: str = CACHE_PATH, ttl: float = CACHE_TTL_SECONDS):
+        self._engine = engine
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = self._open(path, ttl)
+
+    @staticmethod
+    def _open(path: str, ttl: float) -> sqlite3.Connection | None:
+        """Open the cache file, or return None to run uncached if it can't be used."""
+        conn = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            # Expired rows are never read again; drop them so the file stays bounded
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            return conn
+        except (OSError, sqlite3.Error):
+            # Read-only install directory, locked or corrupt file, ...
+            if conn is not None:
+                conn.close()
+            return None
+
+    def __getattr__(self, name):
+        # Anything not cached here (model, client, ...) comes from the engine
+        return getattr(self._engine, name)
+
+    def _get(self, key: str):
+        if self._conn is None:
+            return None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or time.time() - row[1] > self._ttl:
+            return None
+        return orjson.loads(row[0])
+
+    def _set(self, key: str, value) -> None:
+        if self._conn is None:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, orjson.dumps(value), time.time()),
+                )
+        except sqlite3.Error:
+            pass  # The cache is best-effort; a failed write just means a miss later
+
+    def generate_sql(self, schema_description: str, question: str, db_type: str = "sqlite") -> str:
+        """Cached NLEngine.generate_sql."""
+        key = _cache_key("sql", _digest(schema_description), question.strip().lower(), db_type)
+        sql = self._get(key)
+        if sql is None:
+            sql = self._engine.generate_sql(schema_description, question, db_type)
+            self._set(key, sql)
+        return sql
+
+    def generate_sql_batch(
+        self, schema_description: str, questions: list[str], db_type: str = "sqlite"
+    ) -> list[dict]:
+        """Cached NLEngine.generate_sql_batch."""
+        key = _cache_key(
+            "sql_batch",
+            _digest(schema_description),
+            [q.strip().lower() for q in questions],
+            db_type,
+        )
+        specs = self._get(key)
+        if specs is None:
+            specs = self._engine.generate_sql_batch(schema_description, questions, db_type)
+            self._set(key, specs)
+        return specs
+
+    def rewrite_sql(self, sql: str, schema_description: str, db_type: str = "sqlite") -> str:
+        """Cached NLEngine.rewrite_sql."""
+        key = _cache_key("rewrite", _digest(sql), _digest(schema_description), db_type)
+        rewritten = self._get(key)
+        if rewritten is None:
+            rewritten = self._engine.rewrite_sql(sql, schema_description, db_type)
+            self._set(key, rewritten)
+        return rewritten
+
+    def explain_sql(self, sql: str, schema_description: str) -> str:
+        """Cached NLEngine.explain_sql."""
+        key = _cache_key("explain", _digest(sql), _digest(schema_description))
+        explanation = self._get(key)
+        if explanation is None:
+            explanation = self._engine.explain_sql(sql, schema_description)
+            self._set(key, explanation)
+        return explanation
+
+    def suggest_chart_type(self, question: str, columns: list[str], sample_data: list[tuple]) -> dict:
+        """Cached NLEngine.suggest_chart_type."""
+        suggestion = suggest_chart_type_heuristic(question, columns, sample_data)
+        if suggestion is not None:
+            return suggestion
+        # Row counts are bucketed by power of two: 5 vs 500 rows may warrant a
+        # different chart, 480 vs 500 won't
+        key = _cache_key(
+            "chart",
+            question,
+            column_signature(columns, sample_data),
+            len(sample_data).bit_length(),
+        )
+        suggestion = self._get(key)
+        if suggestion is None:
+            suggestion = self._engine.suggest_chart_type(question, columns, sample_data)
+            # Don't persist the stand-in for a refused or empty model reply
+            if suggestion.get("reasoning") != FALLBACK_CHART_REASONING:
+                self._set(key, suggestion)
+        return suggestion
@@ -14,10 +14,16 @@ Tools:
 
 import os
 import json
-from mcp.server.fastmcp import FastMCP
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
+from mcp.server.fastmcp import Context, FastMCP
 from db_manager import DatabaseManager
 from nl_engine import NLEngine
-from chart_generator import generate_chart as create_chart, generate_dashboard, CHART_COLORS, CHART_BORDER_COLORS
+from nl_engine_cache import CachedNLEngine
+from chart_generator import generate_chart as create_chart, generate_dashboard, safe_float, CHART_COLORS, CHART_BORDER_COLORS
 
 # ─── Server Setup ────────────────────────────────────────────────────────────
 
@@ -29,19 +35,51 @@ mcp = FastMCP(
     ),
 )
 
+# Output directories for generated HTML, next to this file
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_CHARTS_DIR = os.path.join(_HERE, "charts")
+_DASHBOARDS_DIR = os.path.join(_HERE, "dashboards")
+os.makedirs(_CHARTS_DIR, exist_ok=True)
+os.makedirs(_DASHBOARDS_DIR, exist_ok=True)
+
+# Worker threads used to build dashboard charts concurrently
+DASHBOARD_WORKERS = 8
+
+# Pass generated SQL through an LLM rewrite for a faster equivalent query
+# before executing it. Costs an extra model call per new query.
+REWRITE_ENABLED = False
+
 # Shared state
 db_manager = DatabaseManager()
-nl_engine: NLEngine | None = None
+nl_engine: CachedNLEngine | None = None
+_engine_lock = threading.Lock()
 
 
-def _get_engine() -> NLEngine:
-    """Get or initialize the NL engine."""
+def _get_engine() -> CachedNLEngine:
+    """Get or initialize the NL engine (answers persist across server restarts)."""
     global nl_engine
     if nl_engine is None:
-        nl_engine = NLEngine()
+        with _engine_lock:
+            if nl_engine is None:
+                nl_engine = CachedNLEngine(NLEngine())
     return nl_engine
 
 
+def _warm_engine() -> None:
+    """Initialize the NL engine ahead of the first tool call."""
+    try:
+        _get_engine()
+    except Exception:
+        pass  # e.g. no API key; the first tool call reports the error
+
+
+def _prepare_sql(engine: CachedNLEngine, sql: str, schema_desc: str) -> str:
+    """Return the SQL to execute: rewritten for speed if REWRITE_ENABLED."""
+    if not REWRITE_ENABLED:
+        return sql
+    return engine.rewrite_sql(sql, schema_desc, db_manager.db_type)
+
+
 # ─── Tool: connect_db ────────────────────────────────────────────────────────
 
 @mcp.tool()
@@ -60,15 +98,12 @@ def connect_db(db_type: str, connection_string: str) -> str:
     """
     try:
         db_manager.connect(db_type, connection_string)
-        schema_desc = db_manager.get_schema_description()
-
-        table_count = len(db_manager.schema)
-        total_rows = sum(t["row_count"] for t in db_manager.schema.values())
+        summary = db_manager.summary()
 
         return (
             f"✅ Connected to {db_type} database successfully!\n\n"
-            f"📊 **{table_count} tables** found with **{total_rows:,} total rows**\n\n"
-            f"**Schema:**\n\n{schema_desc}"
+            f"📊 **{summary['tables']} tables** found with **{summary['rows']:,} total rows**\n\n"
+            f"**Schema:**\n\n{summary['description']}"
         )
     except Exception as e:
         return f"❌ Connection failed: {e}"
@@ -100,10 +135,11 @@ def ask_question(question: str) -> str:
 
     try:
         engine = _get_engine()
-        schema_desc = db_manager.get_schema_description()
+        schema_desc = db_manager.get_filtered_schema_description(question)
 
         # Generate SQL
         sql = engine.generate_sql(schema_desc, question, db_manager.db_type)
+        sql = _prepare_sql(engine, sql, schema_desc)
 
         # Execute query
         result = db_manager.execute_query(sql)
@@ -142,10 +178,11 @@ def generate_chart(question: str, chart_type: str = "") -> str:
 
     try:
         engine = _get_engine()
-        schema_desc = db_manager.get_schema_description()
+        schema_desc = db_manager.get_filtered_schema_description(question)
 
         # Generate and execute SQL
         sql = engine.generate_sql(schema_desc, question, db_manager.db_type)
+        sql = _prepare_sql(engine, sql, schema_desc)
         result = db_manager.execute_query(sql)
 
         if not result["rows"]:
@@ -165,14 +202,13 @@ def generate_chart(question: str, chart_type: str = "") -> str:
             )
 
         # Generate chart
-        output_dir = os.path.join(os.path.dirname(__file__), "charts")
         filepath = create_chart(
             data=result,
             chart_type=suggestion["chart_type"],
             x_column=suggestion["x_column"],
             y_columns=suggestion["y_columns"],
             title=suggestion.get("title", question),
-            output_dir=output_dir,
+            output_dir=_CHARTS_DIR,
         )
 
         return (
@@ -209,7 +245,7 @@ def explain_query(question: str) -> str:
 
     try:
         engine = _get_engine()
-        schema_desc = db_manager.get_schema_description()
+        schema_desc = db_manager.get_filtered_schema_description(question)
 
         # Generate SQL
         sql = engine.generate_sql(schema_desc, question, db_manager.db_type)
@@ -228,8 +264,214 @@ def explain_query(question: str) -> str:
 
 # ─── Tool: save_dashboard ───────────────────────────────────────────────────
 
+def _to_floats(column: tuple) -> list[float]:
+    """Convert a result column to chart values, using 0 for non-numeric cells."""
+    try:
+        # Fast path: the whole column converts in one C-level pass
+        return list(map(float, column))
+    except (TypeError, ValueError):
+        return list(map(safe_float, column))
+
+
+def build_chart_series(
+    rows: list[tuple], x_idx: int, y_indices: list[int]
+) -> tuple[list[str], list[list[float]]]:
+    """
+    Extract chart labels and y-series from result rows.
+
+    The rows are transposed once, so each series is a pass over one column
+    instead of indexing into every row for every y-column.
+
+    Returns:
+        (labels, values) with one list of values per entry in y_indices.
+    """
+    columns = list(zip(*rows))
+    if not columns:
+        return [], [[] for _ in y_indices]
+    labels = list(map(str, columns[x_idx]))
+    return labels, [_to_floats(columns[y_idx]) for y_idx in y_indices]
+
+
+def _chart_series(
+    columns: list[str], suggestion: dict, rows: list[tuple]
+) -> tuple[list[str], list[str], list[list[float]]]:
+    """Resolve the suggested x/y columns and build their series from the rows."""
+    x_col = suggestion.get("x_column", columns[0])
+    y_cols = suggestion.get("y_columns", columns[1:2])
+
+    # One dict lookup per column instead of a list scan for each y-column;
+    # setdefault keeps the first of any duplicate names, as index() did
+    col_idx = {}
+    for i, c in enumerate(columns):
+        col_idx.setdefault(c, i)
+    default_y_idx = 1 if len(columns) > 1 else 0
+    x_idx = col_idx.get(x_col, 0)
+    y_indices = [col_idx.get(yc, default_y_idx) for yc in y_cols]
+    labels, series = build_chart_series(rows, x_idx, y_indices)
+    return labels, y_cols, series
+
+
+def _chart_options(legend: bool, scales: bool = True, **extra) -> dict:
+    """Chart.js options shared by every dashboard chart."""
+    options = {
+        "responsive": True,
+        "maintainAspectRatio": False,
+        "plugins": {"legend": {"display": legend}},
+    }
+    if scales:
+        options["scales"] = {
+            "x": {"display": True},
+            "y": {"display": True, "beginAtZero": True},
+        }
+    options.update(extra)
+    return options
+
+
+def _build_axis_chart(chart_type: str, labels: list[str], datasets: list[dict], **extra) -> dict:
+    """Config for charts drawn on x/y axes; the legend only matters for several series."""
+    return {
+        "type": chart_type,
+        "data": {"labels": labels, "datasets": datasets},
+        "options": _chart_options(len(datasets) > 1, **extra),
+    }
+
+
+def _build_line_chart(labels: list[str], datasets: list[dict]) -> dict:
+    """Config for line charts, drawn as smoothed filled areas."""
+    for ds in datasets:
+        ds["fill"] = True
+        ds["tension"] = 0.4
+    return _build_axis_chart("line", labels, datasets)
+
+
+def _build_radial_chart(chart_type: str, labels: list[str], datasets: list[dict]) -> dict:
+    """Config for pie/doughnut charts: no axes, and the legend names the slices."""
+    return {
+        "type": chart_type,
+        "data": {"labels": labels, "datasets": datasets},
+        "options": _chart_options(True, scales=False),
+    }
+
+
+# Chart.js config builder per suggested chart type
+_CHART_BUILDERS: dict[str, Callable[[list[str], list[dict]], dict]] = {
+    "bar": partial(_build_axis_chart, "bar"),
+    "horizontalBar": partial(_build_axis_chart, "bar", indexAxis="y"),
+    "line": _build_line_chart,
+    "scatter": partial(_build_axis_chart, "scatter"),
+    "pie": partial(_build_radial_chart, "pie"),
+    "doughnut": partial(_build_radial_chart, "doughnut"),
+}
+
+
+def _spec_sql(question: str, spec: dict, engine: CachedNLEngine) -> str:
+    """SQL to execute for a batch spec, rewritten if REWRITE_ENABLED."""
+    if not REWRITE_ENABLED:
+        return spec["sql"]
+    schema_desc = db_manager.get_filtered_schema_description(question)
+    return _prepare_sql(engine, spec["sql"], schema_desc)
+
+
+def _build_chart_for_question(
+    i: int,
+    question: str,
+    engine: CachedNLEngine,
+    spec: dict | None = None,
+    result: dict | None = None,
+) -> tuple[int, dict | None, str | None]:
+    """
+    Generate, execute, and chart a single dashboard question.
+
+    Args:
+        spec: SQL + chart configuration from generate_sql_batch. Without one,
+              the SQL and chart suggestion are requested for this question alone.
+        result: Already-executed result of spec's SQL, shared with other
+                questions that produced the same query.
+
+    Returns:
+        (i, chart, None) on success, or (i, None, error line) on failure.
+    """
+    try:
+        if spec:
+            # The batch call already planned the chart; the result may be shared
+            # with other questions that produced the same SQL
+            suggestion = spec
+            if result is None:
+                result = db_manager.execute_query(_spec_sql(question, spec, engine))
+        else:
+            # Generate and execute SQL
+            schema_desc = db_manager.get_filtered_schema_description(question)
+            sql = engine.generate_sql(schema_desc, question, db_manager.db_type)
+            sql = _prepare_sql(engine, sql, schema_desc)
+            result = db_manager.execute_query(sql)
+
+        if not result["rows"]:
+            return i, None, f"  - Q{i+1}: No data returned"
+
+        if not spec:
+            suggestion = engine.suggest_chart_type(
+                question, result["columns"], result["rows"]
+            )
+        labels, y_cols, series = _chart_series(result["columns"], suggestion, result["rows"])
+
+        # Build Chart.js config
+        datasets = []
+        for j, (yc, values) in enumerate(zip(y_cols, series)):
+            color_idx = j % len(CHART_COLORS)
+            datasets.append({
+                "label": yc,
+                "data": values,
+                "backgroundColor": CHART_COLORS[color_idx],
+                "borderColor": CHART_BORDER_COLORS[color_idx],
+                "borderWidth": 2,
+            })
+
+        chart_type = suggestion["chart_type"]
+        builder = _CHART_BUILDERS.get(chart_type) or partial(_build_axis_chart, chart_type)
+        config = builder(labels, datasets)
+
+        chart = {
+            "title": suggestion.get("title", question),
+            "config": config,
+        }
+        return i, chart, None
+
+    except Exception as e:
+        return i, None, f"  - Q{i+1} ({question}): {e}"
+
+
+def _build_charts_for_group(
+    items: list[tuple[int, str, dict | None]], engine: CachedNLEngine
+) -> list[tuple[int, dict | None, str | None]]:
+    """
+    Chart dashboard questions that share one query, running it only once.
+
+    Args:
+        items: (index, question, spec) for each question in the group. With
+               specs, the group shares identical SQL and each question keeps
+               its own chart configuration; without, the questions are identical.
+
+    Returns:
+        One _build_chart_for_question result per item.
+    """
+    i, question, spec = items[0]
+    if len(items) == 1:
+        return [_build_chart_for_question(i, question, engine, spec)]
+
+    if spec is None:
+        # Identical questions get identical charts
+        _, chart, error = _build_chart_for_question(i, question, engine)
+        return [(j, chart, error) for j, _, _ in items]
+
+    try:
+        result = db_manager.execute_query(_spec_sql(question, spec, engine))
+    except Exception as e:
+        return [(j, None, f"  - Q{j+1} ({q}): {e}") for j, q, _ in items]
+    return [_build_chart_for_question(j, q, engine, s, result) for j, q, s in items]
+
+
 @mcp.tool()
-def save_dashboard(name: str, questions: list[str]) -> str:
+async def save_dashboard(name: str, questions: list[str], ctx: Context) -> str:
     """
     Create a multi-chart dashboard from a list of natural language questions.
 
@@ -249,97 +491,61 @@ def save_dashboard(name: str, questions: list[str]) -> str:
         return "❌ No database connected. Use `connect_db` first."
 
     try:
-        engine = _get_engine()
-        schema_desc = db_manager.get_schema_description()
+        # Blocking work runs in threads so progress notifications can be sent
+        # while charts are still being built
+        engine = await asyncio.to_thread(_get_engine)
+
+        # One LLM call for every question's SQL and chart; fall back to
+        # per-question calls if the batch response is unusable
+        try:
+            schema_desc = db_manager.get_filtered_schema_description_for(questions)
+            specs = await asyncio.to_thread(
+                engine.generate_sql_batch, schema_desc, questions, db_manager.db_type
+            )
+        except Exception:
+            specs = [None] * len(questions)
+
+        # Questions that produced the same SQL (or repeat the same question)
+        # are executed once and charted from the shared result
+        groups: dict[tuple, list] = {}
+        for i, (question, spec) in enumerate(zip(questions, specs)):
+            if spec:
+                key = ("sql", " ".join(spec["sql"].split()))
+            else:
+                key = ("question", question.strip().lower())
+            groups.setdefault(key, []).append((i, question, spec))
+
+        # Groups are independent and I/O-bound (LLM + DB), so run them concurrently
+        # and report progress to the client as each one finishes
+        loop = asyncio.get_running_loop()
+        results = []
+        pool = ThreadPoolExecutor(max_workers=max(1, min(DASHBOARD_WORKERS, len(groups))))
+        try:
+            futures = [
+                loop.run_in_executor(pool, _build_charts_for_group, items, engine)
+                for items in groups.values()
+            ]
+            for future in asyncio.as_completed(futures):
+                results.extend(await future)
+                await ctx.report_progress(len(results), len(questions))
+        finally:
+            # Never wait here: on cancellation or a failed progress report that
+            # would block the event loop until in-flight LLM/DB calls finish
+            pool.shutdown(wait=False, cancel_futures=True)
 
         charts = []
         errors = []
-
-        for i, question in enumerate(questions):
-            try:
-                # Generate and execute SQL
-                sql = engine.generate_sql(schema_desc, question, db_manager.db_type)
-                result = db_manager.execute_query(sql)
-
-                if not result["rows"]:
-                    errors.append(f"  - Q{i+1}: No data returned")
-                    continue
-
-                # Get chart suggestion
-                suggestion = engine.suggest_chart_type(
-                    question, result["columns"], result["rows"]
-                )
-
-                # Build Chart.js config
-                columns = result["columns"]
-                rows = result["rows"]
-
-                x_col = suggestion.get("x_column", columns[0])
-                y_cols = suggestion.get("y_columns", columns[1:2])
-
-                x_idx = columns.index(x_col) if x_col in columns else 0
-                labels = [str(row[x_idx]) for row in rows]
-
-                datasets = []
-                for j, yc in enumerate(y_cols):
-                    y_idx = columns.index(yc) if yc in columns else (1 if len(columns) > 1 else 0)
-                    values = []
-                    for row in rows:
-                        try:
-                            values.append(float(row[y_idx]))
-                        except (TypeError, ValueError):
-                            values.append(0)
-
-                    color_idx = j % len(CHART_COLORS)
-                    ds = {
-                        "label": yc,
-                        "data": values,
-                        "backgroundColor": CHART_COLORS[color_idx],
-                        "borderColor": CHART_BORDER_COLORS[color_idx],
-                        "borderWidth": 2,
-                    }
-                    if suggestion["chart_type"] == "line":
-                        ds["fill"] = True
-                        ds["tension"] = 0.4
-                    datasets.append(ds)
-
-                chart_type = suggestion["chart_type"]
-                config = {
-                    "type": "bar" if chart_type == "horizontalBar" else chart_type,
-                    "data": {"labels": labels, "datasets": datasets},
-                    "options": {
-                        "responsive": True,
-                        "maintainAspectRatio": False,
-                        "plugins": {
-                            "legend": {
-                                "display": len(datasets) > 1 or chart_type in ("pie", "doughnut"),
-                            },
-                        },
-                    },
-                }
-
-                if chart_type not in ("pie", "doughnut"):
-                    config["options"]["scales"] = {
-                        "x": {"display": True},
-                        "y": {"display": True, "beginAtZero": True},
-                    }
-                if chart_type == "horizontalBar":
-                    config["options"]["indexAxis"] = "y"
-
-                charts.append({
-                    "title": suggestion.get("title", question),
-                    "config": config,
-                })
-
-            except Exception as e:
-                errors.append(f"  - Q{i+1} ({question}): {e}")
+        for _, chart, error in sorted(results, key=lambda r: r[0]):
+            if chart:
+                charts.append(chart)
+            else:
+                errors.append(error)
 
         if not charts:
             return f"❌ No charts could be generated.\n\nErrors:\n" + "\n".join(errors)
 
         # Generate dashboard
-        output_dir = os.path.join(os.path.dirname(__file__), "dashboards")
-        filepath = generate_dashboard(charts, name, output_dir)
+        filepath = await asyncio.to_thread(generate_dashboard, charts, name, _DASHBOARDS_DIR)
 
         result_msg = (
             f"📊 Dashboard **\"{name}\"** created successfully!\n\n"
@@ -360,4 +566,6 @@ def save_dashboard(name: str, questions: list[str]) -> str:
 # ─── Entry Point ─────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    # Build the OpenAI client and open the answer cache while the client connects
+    threading.Thread(target=_warm_engine, daemon=True).start()
     mcp.run()